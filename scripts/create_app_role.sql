@@ -2,7 +2,7 @@
 --
 -- Why: the running service should never hold more power than it uses. It does
 -- NOT apply migrations (those run out-of-band as the database owner via
--- `sqlx migrate run` / scripts/render_db_migrate.py), so at runtime it only
+-- `sqlx migrate run` / scripts/render/render_db_migrate.py), so at runtime it only
 -- needs DML — SELECT / INSERT / UPDATE / DELETE. This role therefore has:
 --   * NO SUPERUSER, NO CREATEDB, NO CREATEROLE, NO BYPASSRLS, NO REPLICATION
 --   * NO ownership of the database or its tables (cannot DROP/ALTER schema)
@@ -1,31 +1,37 @@
-from render_shared_functions import *
-
-dotenv_file = load_dotenv()
-
-render_api_base_url = os.getenv('RENDER_API_BASE_URL').rstrip('/')
-render_api_key = os.getenv('RENDER_API_KEY')
-render_service_id = os.getenv('RENDER_API_SERVICE_ID')
-render_owner_id = os.getenv('RENDER_OWNER_ID')
-render_environment_id = os.getenv('RENDER_ENVIRONMENT_ID')
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import render_urls
+from render_shared_functions import (
+    fetch_render_db_id,
+    load_dotenv,
+    migrate_render_db,
+    parse_json,
+    prewarm_dns,
+    require_env_vars,
+    send_delete_request,
+    send_get_request,
+    send_post_request,
+    send_put_request,
+    set_render_api_key,
+    store_database_connection_in_dotenv,
+    wait_for_postgres,
+    wait_for_render_db_connection_info,
+    wait_until,
+)
 
 render_service_base_url = 'https://farms-0ivm.onrender.com'
-base_headers = {
-    'accept': 'application/json',
-    'authorization': f'Bearer {render_api_key}'
-}
+# The session carries the Render API key; don't forward it to our own service.
+render_service_headers = {'authorization': None}
 
 
 def delete_render_db(render_db_id):
     print('Deleting render db')
-    request_url = f'{render_api_base_url}/postgres/{render_db_id}'
-    send_delete_request(request_url, base_headers.copy())
+    send_delete_request(render_urls.postgres_by_id_url(render_db_id))
 
 
-def create_new_render_db():
+def create_new_render_db(render_owner_id, render_environment_id):
     print('Creating new render db')
-    request_url = f'{render_api_base_url}/postgres'
-    headers = base_headers.copy()
-    headers.update({'Content-Type': 'application/json'})
     body = {
         'databaseName': 'farms',
         'databaseUser': 'farmer',
@@ -39,78 +45,105 @@ def create_new_render_db():
             }
         ],
         'version': '18',
-        'name': 'farms-db',
+        'name': render_urls.RENDER_DB_NAME,
         'environmentId': render_environment_id,
         'region': 'frankfurt',
         'ownerId': render_owner_id
     }
-    response = send_post_request(request_url, headers, body)
-    return response.json()
+    response = send_post_request(render_urls.postgres_url(), body=body)
+    return parse_json(response)
 
 
 def update_render_service_env_variable(env_var_key, env_var_value):
     print(f"Updating '{env_var_key}' environment variable")
-    request_url = f'{render_api_base_url}/services/{render_service_id}/env-vars/{env_var_key}'
-    headers = base_headers.copy()
-    headers.update({'Content-Type': 'application/json'})
     body = {
         'value': env_var_value
     }
-    send_put_request(request_url, headers, body)
+    send_put_request(render_urls.env_var_url(env_var_key), body=body)
 
 
 def trigger_render_service_restart():
     print('Triggering render service restart')
-    request_url = f'{render_api_base_url}/services/{render_service_id}/restart'
-    send_post_request(request_url, base_headers.copy())
+    send_post_request(render_urls.restart_url())
 
 
 def test_render_service():
     print('Testing render service')
-    request_url = f'{render_service_base_url}/health_check'
-    response = send_get_request(request_url, headers=None)
-    assert response.status_code == 200
-
-    request_url = f'{render_api_base_url}/farms'
-    response = send_get_request(request_url, headers=None)
-    assert response.status_code == 200
-
-
-existing_render_db_id = fetch_render_db_id(render_api_base_url, base_headers)
-delete_render_db(existing_render_db_id)
-
-new_render_db = create_new_render_db()
-print('Sleeping for 20s')
-time.sleep(20)
-
-new_render_db_connection_info = fetch_render_db_connection_info(
-    new_render_db['id'],
-    render_api_base_url,
-    base_headers
-)
-
-store_database_connection_in_dotenv(new_render_db_connection_info['externalConnectionString'], dotenv_file)
-wait_for_postgres(new_render_db_connection_info['externalConnectionString'])
-migrate_render_db()
-
-# update_render_service_env_variable(
-#    'DATABASE_URL',
-#    new_render_db_connection_info['internalConnectionString']
-# )
-update_render_service_env_variable(
-    'APP_DATABASE__DATABASE_NAME',
-    new_render_db['databaseName']
-)
-update_render_service_env_variable(
-    'APP_DATABASE__HOST',
-    new_render_db['id']
-)
-update_render_service_env_variable(
-    'APP_DATABASE__PASSWORD',
-    new_render_db_connection_info['password']
-)
-
-trigger_render_service_restart()
-print('Sleeping for 5s')
-time.sleep(5)
-test_render_service()
+    # The two probes hit different hosts and don't depend on each other.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        health_check = executor.submit(
+            send_get_request,
+            f'{render_service_base_url}/health_check',
+            render_service_headers
+        )
+        farms = executor.submit(send_get_request, render_urls.farms_url())
+        assert health_check.result().status_code == 200
+        assert farms.result().status_code == 200
+
+
+def is_render_service_healthy():
+    try:
+        response = send_get_request(
+            f'{render_service_base_url}/health_check',
+            render_service_headers,
+            retry=False
+        )
+        return response.status_code == 200
+    except Exception:
+        return False
+
+
+def main():
+    dotenv_file = load_dotenv()
+    require_env_vars(
+        'RENDER_API_BASE_URL',
+        'RENDER_API_KEY',
+        'RENDER_API_SERVICE_ID',
+        'RENDER_OWNER_ID',
+        'RENDER_ENVIRONMENT_ID'
+    )
+
+    set_render_api_key(os.getenv('RENDER_API_KEY'))
+    # The API host is hit straight away; only the service host has time to resolve.
+    prewarm_dns(render_service_base_url)
+
+    existing_render_db_id = fetch_render_db_id()
+    delete_render_db(existing_render_db_id)
+
+    new_render_db = create_new_render_db(
+        os.getenv('RENDER_OWNER_ID'),
+        os.getenv('RENDER_ENVIRONMENT_ID')
+    )
+    print('Waiting for new render db connection info')
+    new_render_db_connection_info = wait_for_render_db_connection_info(new_render_db['id'])
+
+    store_database_connection_in_dotenv(new_render_db_connection_info['externalConnectionString'], dotenv_file)
+    wait_for_postgres(new_render_db_connection_info['externalConnectionString'])
+    migrate_render_db()
+
+    # update_render_service_env_variable(
+    #    'DATABASE_URL',
+    #    new_render_db_connection_info['internalConnectionString']
+    # )
+    env_var_updates = [
+        ('APP_DATABASE__DATABASE_NAME', new_render_db['databaseName']),
+        ('APP_DATABASE__HOST', new_render_db['id']),
+        ('APP_DATABASE__PASSWORD', new_render_db_connection_info['password']),
+    ]
+    # The updates are independent, so overlap their round trips on the shared session.
+    with ThreadPoolExecutor(max_workers=len(env_var_updates)) as executor:
+        futures = [
+            executor.submit(update_render_service_env_variable, key, value)
+            for key, value in env_var_updates
+        ]
+        for future in futures:
+            future.result()
+
+    trigger_render_service_restart()
+    print('Waiting for render service to become healthy')
+    wait_until(is_render_service_healthy)
+    test_render_service()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,21 +1,29 @@
-from render_shared_functions import *
+import os
 
-dotenv_file = load_dotenv()
+from render_shared_functions import (
+    fetch_render_db_connection_info,
+    fetch_render_db_id,
+    load_dotenv,
+    migrate_render_db,
+    require_env_vars,
+    set_render_api_key,
+    store_database_connection_in_dotenv,
+    wait_for_postgres,
+)
 
-render_api_base_url = os.getenv('RENDER_API_BASE_URL').rstrip('/')
-render_api_key = os.getenv('RENDER_API_KEY')
 
-base_headers = {
-    'accept': 'application/json',
-    'authorization': f'Bearer {render_api_key}'
-}
+def main():
+    dotenv_file = load_dotenv()
+    require_env_vars('RENDER_API_BASE_URL', 'RENDER_API_KEY')
 
-render_db_id = fetch_render_db_id(render_api_base_url, base_headers)
-render_db_connection_info = fetch_render_db_connection_info(
-    render_db_id,
-    render_api_base_url,
-    base_headers
-)
-store_database_connection_in_dotenv(render_db_connection_info['externalConnectionString'], dotenv_file)
-wait_for_postgres(render_db_connection_info['externalConnectionString'])
-migrate_render_db()
+    set_render_api_key(os.getenv('RENDER_API_KEY'))
+
+    render_db_id = fetch_render_db_id()
+    render_db_connection_info = fetch_render_db_connection_info(render_db_id)
+    store_database_connection_in_dotenv(render_db_connection_info['externalConnectionString'], dotenv_file)
+    wait_for_postgres(render_db_connection_info['externalConnectionString'])
+    migrate_render_db()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,17 +1,104 @@
+import atexit
+import io
 import os
+import random
+import re
+import shutil
+import socket
 import subprocess
+import sys
+import threading
 import time
 from pathlib import Path
 from urllib.parse import urlparse
 
 import dotenv
+import orjson
 import psycopg2
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+import render_urls
+
+__all__ = [
+    'RenderApiError',
+    'RenderApiUnreachableError',
+    'load_dotenv',
+    'require_env_vars',
+    'set_render_api_key',
+    'prewarm_dns',
+    'send_get_request',
+    'send_post_request',
+    'send_put_request',
+    'send_delete_request',
+    'parse_json',
+    'fetch_render_db_id',
+    'fetch_render_db_connection_info',
+    'wait_until',
+    'wait_for_render_db_connection_info',
+    'store_in_dotenv',
+    'store_many_in_dotenv',
+    'store_database_connection_in_dotenv',
+    'wait_for_postgres',
+    'migrate_render_db',
+]
+
+# One session for the whole run, so consecutive calls to the same host reuse
+# the pooled TLS connection instead of paying a fresh handshake each time.
+# Transient Render errors are retried with backoff rather than aborting the run.
+# POST is left out: a create that succeeded behind a gateway error or read
+# timeout must not be resent, and the restart doesn't need it either.
+_TRANSIENT_STATUSES = (429, 502, 503, 504)
+_retry = Retry(
+    total=5,
+    backoff_factor=0.5,
+    status_forcelist=_TRANSIENT_STATUSES,
+    allowed_methods=frozenset(['GET', 'PUT', 'DELETE']),
+    respect_retry_after_header=True
+)
+_session = requests.Session()
+_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=_retry))
+_session.headers.update({'accept': 'application/json'})
+atexit.register(_session.close)
+
+# Polling probes already back off in `wait_until`, so they go through a
+# session without retries. It shares the headers (and so the API key).
+_probe_session = requests.Session()
+_probe_session.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=0))
+_probe_session.headers = _session.headers
+atexit.register(_probe_session.close)
+
+# (connect, read) seconds, so a stalled connection can't hang the script.
+_REQUEST_TIMEOUT = (5, 30)
+
+
+class RenderApiError(Exception):
+    """A request that failed; `status_code` is None when no response came back."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class RenderApiUnreachableError(RenderApiError):
+    """The request failed to connect or timed out."""
+
+
+def _render_api_error(e):
+    message = "HTTP Error: {}".format(e.args[0])
+    if isinstance(e, (requests.ConnectionError, requests.Timeout)):
+        return RenderApiUnreachableError(message)
+    status_code = e.response.status_code if e.response is not None else None
+    return RenderApiError(message, status_code)
 
 
 def load_dotenv():
     print('Loading Dotenv')
-    dotenv_file = dotenv.find_dotenv()
+    # The .env lives at the repository root; only walk the tree if it isn't there.
+    dotenv_file = str(Path(__file__).resolve().parents[2] / '.env')
+    if not os.path.exists(dotenv_file):
+        dotenv_file = dotenv.find_dotenv()
 
     if not dotenv_file:
         dotenv_file = os.path.join(os.getcwd(), '.env')
@@ -21,64 +108,141 @@ def load_dotenv():
     return dotenv_file
 
 
-def send_get_request(url, headers):
+def require_env_vars(*var_keys):
+    """Exit before any API call if one of `var_keys` is unset or empty."""
+    missing = [key for key in var_keys if not os.environ.get(key)]
+    if missing:
+        sys.exit(f'Missing env vars: {missing}')
+
+
+def set_render_api_key(render_api_key):
+    _session.headers['authorization'] = f'Bearer {render_api_key}'
+
+
+def prewarm_dns(*urls):
+    """Resolve the hosts of `urls` in the background so the first request to each finds them cached."""
+    def resolve():
+        for url in urls:
+            try:
+                socket.getaddrinfo(urlparse(url).hostname, 443)
+            except socket.gaierror:
+                pass
+
+    threading.Thread(target=resolve, daemon=True).start()
+
+
+def _json_headers(headers, body):
+    if body is None:
+        return headers
+    return {**(headers or {}), 'Content-Type': 'application/json'}
+
+
+def _json_body(body):
+    return orjson.dumps(body) if body is not None else None
+
+
+def parse_json(response):
+    return orjson.loads(response.content)
+
+
+def send_get_request(url, headers=None, retry=True):
     print(f'Sending GET request to: {url}')
+    session = _session if retry else _probe_session
     try:
-        r = requests.get(url, headers=headers)
+        r = session.get(url, headers=headers, timeout=_REQUEST_TIMEOUT)
         r.raise_for_status()
         return r
     except requests.exceptions.RequestException as e:
-        raise Exception("HTTP Error: {}".format(e.args[0]))
+        raise _render_api_error(e) from e
 
 
-def send_post_request(url, headers, body=None):
+def send_post_request(url, headers=None, body=None):
     print(f'Sending POST request to: {url}')
     try:
-        r = requests.post(url, headers=headers, json=body)
+        r = _session.post(url, headers=_json_headers(headers, body), data=_json_body(body), timeout=_REQUEST_TIMEOUT)
         r.raise_for_status()
         return r
     except requests.exceptions.RequestException as e:
-        raise Exception("HTTP Error: {}".format(e.args[0]))
+        raise _render_api_error(e) from e
 
 
-def send_put_request(url, headers, body):
+def send_put_request(url, headers=None, body=None):
     print(f'Sending PUT request to: {url}')
     try:
-        r = requests.put(url, headers=headers, json=body)
+        r = _session.put(url, headers=_json_headers(headers, body), data=_json_body(body), timeout=_REQUEST_TIMEOUT)
         r.raise_for_status()
         return r
     except requests.exceptions.RequestException as e:
-        raise Exception("HTTP Error: {}".format(e.args[0]))
+        raise _render_api_error(e) from e
 
 
-def send_delete_request(url, headers):
+def send_delete_request(url, headers=None):
     print(f'Sending DELETE request to: {url}')
     try:
-        r = requests.delete(url, headers=headers)
+        r = _session.delete(url, headers=headers, timeout=_REQUEST_TIMEOUT)
         r.raise_for_status()
         return r
     except requests.exceptions.RequestException as e:
-        raise Exception("HTTP Error: {}".format(e.args[0]))
+        raise _render_api_error(e) from e
 
 
-def fetch_render_db_id(render_api_base_url, base_headers):
+def fetch_render_db_id():
     print('Fetching Database Id')
-    request_url = f'{render_api_base_url}/postgres?includeReplicas=true&limit=20'
-    response = send_get_request(request_url, base_headers)
-    return response.json()[0]['postgres']['id']
+    response = send_get_request(render_urls.postgres_list_url())
+    return parse_json(response)[0]['postgres']['id']
 
 
-def fetch_render_db_connection_info(render_db_id, render_api_base_url, base_headers):
+def fetch_render_db_connection_info(render_db_id, retry=True):
     print('Fetching Database Connection Info')
-    request_url = f'{render_api_base_url}/postgres/{render_db_id}/connection-info'
-    response = send_get_request(request_url, base_headers)
+    response = send_get_request(render_urls.connection_info_url(render_db_id), retry=retry)
     # {
     #   "password": "string",
     #   "internalConnectionString": "string",
     #   "externalConnectionString": "string",
     #   "psqlCommand": "string"
     # }
-    return response.json()
+    return parse_json(response)
+
+
+def wait_until(probe_fn, initial=0.5, factor=2.0, max_delay=8.0, timeout=120, jitter=0.2):
+    """Poll `probe_fn` with jittered exponential backoff until it returns True."""
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        if probe_fn():
+            return True
+
+        delay = min(max_delay, initial * factor ** attempt) * (1 + random.uniform(-jitter, jitter))
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise Exception(f'Condition not met within {timeout}s')
+
+        print(f'Not ready yet, retrying in {delay:.1f}s (attempt {attempt + 1})')
+        time.sleep(min(delay, remaining))
+        attempt += 1
+
+
+def wait_for_render_db_connection_info(render_db_id):
+    """Poll until Render exposes the connection info of a newly created database."""
+    connection_info = {}
+
+    def probe():
+        try:
+            connection_info.update(
+                fetch_render_db_connection_info(render_db_id, retry=False)
+            )
+            return True
+        except RenderApiUnreachableError:
+            return False
+        except RenderApiError as e:
+            # 404/409 mean the database is still being provisioned; transient
+            # errors are left to `wait_until`'s backoff.
+            if e.status_code in (404, 409, *_TRANSIENT_STATUSES):
+                return False
+            raise
+
+    wait_until(probe)
+    return connection_info
 
 
 def store_in_dotenv(var_key, var_value, dotenv_file):
@@ -87,6 +251,39 @@ def store_in_dotenv(var_key, var_value, dotenv_file):
     dotenv.set_key(dotenv_file, var_key, var_value)
 
 
+def _quote_dotenv_value(value):
+    escaped = value.replace('\\', '\\\\').replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def store_many_in_dotenv(pairs, dotenv_file):
+    """Store several variables with a single read and a single atomic rewrite of the dotenv file.
+
+    Values are written back uninterpolated, `export` prefixes and the file mode are kept.
+    Unlike `dotenv.set_key`, comments in the file are not preserved.
+    """
+    print(f"Storing {', '.join(repr(key) for key in pairs)} in dotenv file.")
+    os.environ.update(pairs)
+
+    content = Path(dotenv_file).read_text() if os.path.exists(dotenv_file) else ''
+    exported = set(re.findall(r'^\s*export\s+([^\s=]+)', content, re.MULTILINE))
+    values = dotenv.dotenv_values(stream=io.StringIO(content), interpolate=False)
+    values.update(pairs)
+
+    lines = []
+    for key, value in values.items():
+        line = key if value is None else f'{key}={_quote_dotenv_value(value)}'
+        lines.append(f'export {line}' if key in exported else line)
+
+    tmp_file = f'{dotenv_file}.tmp'
+    # Created owner-only: the file holds database credentials.
+    with open(tmp_file, 'w', opener=lambda path, flags: os.open(path, flags, 0o600)) as f:
+        f.write('\n'.join(lines) + '\n')
+    if os.path.exists(dotenv_file):
+        shutil.copymode(dotenv_file, tmp_file)
+    os.replace(tmp_file, dotenv_file)
+
+
 def store_database_connection_in_dotenv(db_connection_string, dotenv_file):
     print('Storing Database Connection string')
     store_in_dotenv('DATABASE_URL', db_connection_string, dotenv_file)
@@ -118,17 +315,8 @@ def wait_for_postgres(connection_string, max_retries=60, delay=5):
 def migrate_render_db():
     print('Migrating Database')
     try:
-        result = subprocess.run(
-            ['sqlx', 'migrate', 'run'],
-            capture_output=True,
-            text=True,
-            check=True
-        )
+        # Inherit our stdout/stderr so sqlx's progress is shown as it happens.
+        subprocess.run(['sqlx', 'migrate', 'run'], check=True)
         print('Migration successful')
-        print('Output:', result.stdout)
-        if result.stderr:
-            print('Stderr:', result.stderr)
     except subprocess.CalledProcessError as e:
         print(f'Migration failed with exit code {e.returncode}')
-        print("Output:", e.stdout)
-        print("Error:", e.stderr)
@@ -0,0 +1,53 @@
+"""Render API URLs, built from the environment once on first use.
+
+The values are read lazily (rather than at import) so that they pick up
+whatever `load_dotenv()` has loaded by the time the first request is made.
+"""
+import os
+from functools import cache
+
+# Name the refresh script creates the database under, and the one looked up by.
+RENDER_DB_NAME = 'farms-db'
+
+
+@cache
+def api_base_url():
+    return os.getenv('RENDER_API_BASE_URL').rstrip('/')
+
+
+@cache
+def postgres_url():
+    return f'{api_base_url()}/postgres'
+
+
+@cache
+def postgres_list_url():
+    # Only the first result is used, so filter to our instance and fetch just that.
+    return f'{postgres_url()}?name={RENDER_DB_NAME}&includeReplicas=true&limit=1'
+
+
+def postgres_by_id_url(render_db_id):
+    return f'{postgres_url()}/{render_db_id}'
+
+
+def connection_info_url(render_db_id):
+    return f'{postgres_by_id_url(render_db_id)}/connection-info'
+
+
+@cache
+def service_url():
+    return f"{api_base_url()}/services/{os.getenv('RENDER_API_SERVICE_ID')}"
+
+
+def env_var_url(env_var_key):
+    return f'{service_url()}/env-vars/{env_var_key}'
+
+
+@cache
+def restart_url():
+    return f'{service_url()}/restart'
+
+
+@cache
+def farms_url():
+    return f'{api_base_url()}/farms'
@@ -0,0 +1,58 @@
+import os
+import stat
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import dotenv
+
+from render_shared_functions import store_many_in_dotenv
+
+
+class StoreManyInDotenvTest(unittest.TestCase):
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.dotenv_file = os.path.join(tmp_dir.name, '.env')
+        Path(self.dotenv_file).write_text(
+            'BASE=/srv\n'
+            'PATHX=${BASE}/x\n'
+            'export EXP=1\n'
+        )
+        os.chmod(self.dotenv_file, 0o600)
+
+        patched_environ = mock.patch.dict(os.environ)
+        patched_environ.start()
+        self.addCleanup(patched_environ.stop)
+
+    def test_round_trips_quotes_and_variable_references(self):
+        store_many_in_dotenv(
+            {'PW': 'it\'s a "secret" \\ here', 'DATABASE_URL': 'postgres://u:p@h/db'},
+            self.dotenv_file
+        )
+
+        self.assertEqual(
+            dotenv.dotenv_values(self.dotenv_file),
+            {
+                'BASE': '/srv',
+                'PATHX': '/srv/x',
+                'EXP': '1',
+                'PW': 'it\'s a "secret" \\ here',
+                'DATABASE_URL': 'postgres://u:p@h/db',
+            }
+        )
+        self.assertEqual(
+            dotenv.dotenv_values(self.dotenv_file, interpolate=False)['PATHX'],
+            '${BASE}/x'
+        )
+
+    def test_keeps_export_prefix_and_file_mode(self):
+        store_many_in_dotenv({'EXP': '2'}, self.dotenv_file)
+
+        self.assertIn('export EXP="2"', Path(self.dotenv_file).read_text().splitlines())
+        self.assertEqual(stat.S_IMODE(os.stat(self.dotenv_file).st_mode), 0o600)
+
+
+if __name__ == '__main__':
+    unittest.main()